@@ -1,23 +1,60 @@
-from typing import Any, Dict, Generic, List, Optional, Type, TypeVar
+import sys
+from collections import defaultdict
+from typing import (
+    Any,
+    Callable,
+    DefaultDict,
+    Dict,
+    Generic,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Tuple,
+    Type,
+    TypeVar,
+    Union,
+    get_args,
+    get_origin,
+)
+from weakref import WeakKeyDictionary
 
 from pydantic import BaseModel
+from pydantic.fields import FieldInfo
+
+try:
+    from types import UnionType  # type: ignore[attr-defined]
+
+    _UNION_ORIGINS: Tuple[Any, ...] = (Union, UnionType)
+except ImportError:
+    # `X | Y` unions were introduced in python 3.10
+    _UNION_ORIGINS = (Union,)
 
 
 def _is_schema(obj: Any):
     """
     Check is an arbitrary object is a pydantic model/config (sub)schema.
     """
+    # Most annotations aren't classes at all, so rule those out without raising
+    if not isinstance(obj, type):
+        return False
     try:
         return issubclass(obj, BaseModel)
     except TypeError:
+        # Generic aliases like `list[int]` pass the check above on python<3.11
         return False
 
 
-def _path_to_var_name(path: List[str]):
+def _unwrap_optional(annotation: Any):
     """
-    Convert a config schema path to an environment variable name.
+    Unwrap an `Optional[X]` annotation to `X`; anything else is returned as-is.
     """
-    return "_".join([segment.upper() for segment in path])
+    if get_origin(annotation) in _UNION_ORIGINS:
+        args = [arg for arg in get_args(annotation) if arg is not type(None)]
+        if len(args) == 1:
+            return args[0]
+    return annotation
 
 
 def _normalize_var_prefix(var_prefix: str):
@@ -30,32 +67,65 @@ def _normalize_var_prefix(var_prefix: str):
         return f"{var_prefix}_"
 
 
-def _strip_var_prefix(prefix: str, prefixed_key: str):
+def _preprocess_var_dict(prefix: Optional[str], var_dict: Mapping[str, Optional[str]]):
     """
-    Strip the common prefix off of an environment variable.
+    Pre-process a dictionary of variables
+
+    Empty variables are dropped and, if a prefix is given, so is anything not prefixed
+    by it; the prefix is stripped off of what remains. This is all done in one pass.
     """
+    if prefix is None:
+        return {k: v for k, v in var_dict.items() if v is not None}
+
     normalized_prefix = _normalize_var_prefix(prefix)
-    return prefixed_key[len(normalized_prefix) :]
+    prefix_length = len(normalized_prefix)
+    return {
+        k[prefix_length:]: v
+        for k, v in var_dict.items()
+        if v is not None and k.startswith(normalized_prefix)
+    }
 
 
-def _preprocess_var_dict(prefix: Optional[str], var_dict: Dict[str, Optional[str]]):
-    """
-    Pre-process a dictionary of variables
-    """
-    non_empty = {k: v for k, v in var_dict.items() if v is not None}
+_Op = Tuple[str, Tuple[str, ...], str]
 
-    preprocessed = non_empty
-    if prefix is not None:
-        normalized_prefix = _normalize_var_prefix(prefix)
-        # Remove anything not prefixed by the prefix
-        prefixed = {
-            k: v for k, v in non_empty.items() if k.startswith(normalized_prefix)
-        }
-        # Strip the prefix away
-        preprocessed = {_strip_var_prefix(prefix, k): v for k, v in prefixed.items()}
 
-    return preprocessed
+def _compile_proto_config_builder(
+    ops: Tuple[_Op, ...]
+) -> Callable[[Mapping[str, Optional[str]]], Dict[str, Any]]:
+    """
+    Generate a function that reformats a var dict into proto config for a specific set
+    of schema paths.
 
+    Every var name and path segment is written into the generated source as a
+    literal, so the function does no table lookups or looping of its own.
+    """
+    lines = ["def build(var_dict):", "    root = {}"]
+    for var_name, parent_segments, leaf_segment in ops:
+        lines.append(f"    value = var_dict.get({var_name!r})")
+        lines.append("    if value is not None:")
+        level = "root"
+        for segment in parent_segments:
+            lines.append(f"        level = {level}.setdefault({segment!r}, {{}})")
+            level = "level"
+        lines.append(f"        {level}[{leaf_segment!r}] = value")
+    lines.append("    return root")
+
+    namespace: Dict[str, Any] = {}
+    code = compile("\n".join(lines), "<pydantic_env proto config builder>", "exec")
+    exec(code, namespace)
+    return namespace["build"]
+
+
+_CompiledSchema = Tuple[
+    Dict[str, List[str]],
+    Callable[[Mapping[str, Optional[str]]], Dict[str, Any]],
+]
+
+# Everything derived from a schema on parser construction, keyed weakly by schema so
+# that re-instantiating parsers for a schema skips the schema walk and code generation
+_compiled_schemas: "WeakKeyDictionary[Type[BaseModel], _CompiledSchema]" = (
+    WeakKeyDictionary()
+)
 
 T = TypeVar("T", bound=BaseModel)
 
@@ -67,6 +137,8 @@ class ConfigParser(Generic[T]):
     Attributes:
     - schema: Pydantic model/schema used for validation.
     - var_prefix: Prefix used to filter environment variables.
+    - strict: Whether variables that do not correspond to any schema path are
+      rejected, rather than silently ignored.
 
     Example:
     ```
@@ -93,12 +165,10 @@ class ConfigParser(Generic[T]):
     # Config parsers can specify a prefix to expect from environment variables
     config_parser = ConfigParser(AppConfig, "MYAPP")
 
-    # Config can be parsed from any dictionary source, such as:
-    # - the environment
+    # Config can be parsed from any mapping source, such as:
+    # - the environment (`os.environ` can be passed as-is, without copying it)
     # - dotenv files
-    validated_config = config_parser.parse({
-        **os.environ
-    })
+    validated_config = config_parser.parse(os.environ)
 
     print(validated_config)
     # If the environment consisted of:
@@ -114,6 +184,18 @@ class ConfigParser(Generic[T]):
     ```
     """
 
+    __slots__ = (
+        "schema",
+        "var_prefix",
+        "strict",
+        "_path_table",
+        "_build_proto_config",
+        "_expected_var_names",
+        "_expected_var_names_sorted",
+        "_validate",
+        "__weakref__",
+    )
+
     schema: Type[T]
     """
     """
@@ -122,32 +204,115 @@ class ConfigParser(Generic[T]):
     """
     """
 
-    def __init__(self, schema: Type[T], var_prefix: Optional[str]):
+    strict: bool
+    """
+    """
+
+    def __init__(self, schema: Type[T], var_prefix: Optional[str], strict: bool = True):
         self.schema = schema
         self.var_prefix = var_prefix
-
-    def _paths(
-        self, sub_schema: Optional[Type[BaseModel]], path_prefix: List[str] = []
-    ):
+        self.strict = strict
+        # Bound once so that each parse goes straight to the schema's core validator.
+        # This fails for schemas with unresolved forward refs, so it's done before
+        # anything is derived from (and cached for) the schema
+        self._validate = schema.__pydantic_validator__.validate_python
+        # The schema is fixed for the lifetime of the parser, so the table is built
+        # once, eagerly; this also surfaces ambiguous schemas at construction time.
+        # Parsers for a schema that has been compiled before reuse its artifacts, as
+        # long as it's complete; an incomplete schema's fields may change when it's
+        # rebuilt
+        complete = schema.__pydantic_complete__
+        compiled = _compiled_schemas.get(schema) if complete else None
+        if compiled is None:
+            path_table = self._build_path_table()
+            # A flat sequence of ops, one per path: the var name to match, the segments
+            # of the levels the path nests under, and the key of its value on the
+            # innermost level
+            ops = tuple(
+                (var_name, tuple(path[:-1]), path[-1])
+                for var_name, path in path_table.items()
+            )
+            # The ops are only needed to generate the builder, so they aren't kept
+            compiled = (path_table, _compile_proto_config_builder(ops))
+            if complete:
+                _compiled_schemas[schema] = compiled
+        self._path_table, self._build_proto_config = compiled
+        self._expected_var_names = frozenset(self._path_table)
+        self._expected_var_names_sorted = sorted(self._path_table)
+
+    def __reduce__(self):
+        # The generated builder can't be pickled, so parsers are pickled by their
+        # arguments and rebuilt (cheaply, from the per-schema cache) on unpickling
+        return (type(self), (self.schema, self.var_prefix, self.strict))
+
+    def _var_name_path_pairs(self, sub_schema: Optional[Type[BaseModel]] = None):
         """
-        Obtain all path strings for a config schema.
+        Obtain all paths for a config schema, each paired with its environment
+        variable name.
+
+        The schema is walked depth-first with an explicit stack of field iterators and
+        a single mutable path, which is only copied when a leaf is reached. The
+        capsed path is kept alongside it so that each segment is only capsed once.
+
+        The schemas on the current descent path are tracked as well, so that cyclic
+        schemas are reported rather than walked forever. Optional fields that close a
+        cycle are treated as leaves instead.
         """
         if sub_schema is None:
             sub_schema = self.schema
 
-        paths: List[List[str]] = []
-        for key, value in sub_schema.model_fields.items():
-            # Check to see if this is an aliased field and update it if so
-            if value.alias is not None:
-                key = value.alias
-            prefixed_key = path_prefix + [key]
-            annotation = value.annotation
-            if _is_schema(annotation):
-                paths.extend(self._paths(annotation, prefixed_key))
+        pairs: List[Tuple[str, List[str]]] = []
+        path: List[str] = []
+        upper_path: List[str] = []
+        stack: List[Iterator[Tuple[str, FieldInfo]]] = [
+            iter(sub_schema.model_fields.items())
+        ]
+        # The schema each frame of the stack iterates the fields of
+        schemas: List[Type[BaseModel]] = [sub_schema]
+        while stack:
+            for key, value in stack[-1]:
+                # Check to see if this is an aliased field and update it if so
+                if value.alias is not None:
+                    key = value.alias
+                annotation = _unwrap_optional(value.annotation)
+                if annotation is not value.annotation and annotation in schemas:
+                    # An optional that recurses into a schema it's nested under, e.g.
+                    # a self-referential model, is left as a leaf as though it hadn't
+                    # been unwrapped
+                    annotation = value.annotation
+                if _is_schema(annotation):
+                    if annotation in schemas:
+                        message = (
+                            f"Cannot load config; schema path `{path + [key]}` "
+                            + f"re-enters `{annotation.__name__}`, which it is nested "
+                            + "under."
+                        )
+                        raise RuntimeError(message)
+                    # Descend into the sub-schema; this frame resumes once it's done
+                    path.append(key)
+                    upper_path.append(key.upper())
+                    stack.append(iter(annotation.model_fields.items()))
+                    schemas.append(annotation)
+                    break
+                upper_path.append(key.upper())
+                # Var names are interned since they're used as lookup keys for the
+                # lifetime of the parser
+                pairs.append((sys.intern("_".join(upper_path)), path + [key]))
+                upper_path.pop()
             else:
-                paths.append(prefixed_key)
+                stack.pop()
+                schemas.pop()
+                if path:
+                    path.pop()
+                    upper_path.pop()
 
-        return paths
+        return pairs
+
+    def _paths(self, sub_schema: Optional[Type[BaseModel]] = None):
+        """
+        Obtain all path strings for a config schema.
+        """
+        return [path for _, path in self._var_name_path_pairs(sub_schema)]
 
     def var_name_to_path_table(self):
         """
@@ -176,25 +341,30 @@ class ConfigParser(Generic[T]):
         # }
         ```
         """
-        paths = self._paths(None)
+        # The table is shared by every parser of the schema, so callers get a copy
+        return {k: list(v) for k, v in self._path_table.items()}
+
+    def _build_path_table(self):
+        """
+        Walk the schema to create the map between environment variable names and
+        schema paths, checking that no two paths share a variable name.
+        """
+        pairs = self._var_name_path_pairs()
 
-        pairs = [(_path_to_var_name(path), path) for path in paths]
-        var_names = [var_name for var_name, _ in pairs]
+        var_name_to_paths: DefaultDict[str, List[List[str]]] = defaultdict(list)
+        for var_name, path in pairs:
+            var_name_to_paths[var_name].append(path)
 
-        duplicate_indices = [
-            i for i, var_name in enumerate(var_names) if var_names.count(var_name) > 1
+        unique_duplicated_var_names = [
+            var_name for var_name, paths in var_name_to_paths.items() if len(paths) > 1
         ]
-        if len(duplicate_indices) > 0:
-            unique_duplicated_var_names = set(var_names[i] for i in duplicate_indices)
-
+        if len(unique_duplicated_var_names) > 0:
             message_components = [
                 "Cannot load config; ambiguous environment variable names based on"
                 + "schema paths."
             ]
             for duplicated_var_name in unique_duplicated_var_names:
-                schema_paths = [
-                    path for var_name, path in pairs if var_name == duplicated_var_name
-                ]
+                schema_paths = var_name_to_paths[duplicated_var_name]
                 message_components.append(
                     f"Paths `{schema_paths}` all resolve to the environment variable "
                     + f"`{duplicated_var_name}`"
@@ -205,45 +375,39 @@ class ConfigParser(Generic[T]):
 
         return {k: v for k, v in pairs}
 
-    def _var_dict_to_proto_config(self, var_dict: Dict[str, str]):
+    def _var_dict_to_proto_config(self, var_dict: Mapping[str, Optional[str]]):
         """
         Take a var dict and a path lookup and reformat the values in the var dict
         so that they sit in a nested dictionary that can be supplied to a schema
         validator.
 
         Such a nested dictionary is referred to as "proto config".
-        """
-        path_lookup = self.var_name_to_path_table()
-
-        root: Dict[str, Any] = {}
-
-        for var_name, value in var_dict.items():
-            if var_name not in path_lookup:
-                message = f"""Extra var `{var_name}` found in var dict; expected one of
-                {list(path_lookup.keys())}
-                """
-                raise RuntimeError(message)
-
-            path = path_lookup[var_name]
-            path_length = len(path)
-
-            curr_level = root
-            for depth, segment in enumerate(path):
-                if depth < path_length - 1:
-                    if curr_level.get(segment) is None:
-                        curr_level[segment] = {}
-                    curr_level = curr_level[segment]
-                else:
-                    curr_level[segment] = value
 
-        return root
-
-    def parse(self, var_dict: Dict[str, Optional[str]]) -> T:
+        The reformatting is done by a builder generated from the schema at
+        construction time, so its cost is bounded by the schema rather than by the var
+        dict, which may be an entire shell environment. Vars that don't correspond to
+        any schema path are rejected in strict mode and ignored otherwise; missing vars
+        are left to the schema validator.
+        """
+        if self.strict:
+            expected_var_names = self._expected_var_names
+            for var_name, value in var_dict.items():
+                if value is not None and var_name not in expected_var_names:
+                    message = (
+                        f"Extra var `{var_name}` found in var dict; expected one of\n"
+                        + f"{self._expected_var_names_sorted}"
+                    )
+                    raise RuntimeError(message)
+
+        return self._build_proto_config(var_dict)
+
+    def parse(self, var_dict: Mapping[str, Optional[str]]) -> T:
         """
         Parse and validate configuration from a dictionary of environment variables.
 
         Args:
-        - var_dict (Dict[str, Optional[str]]): Dictionary of environment variables.
+        - var_dict (Mapping[str, Optional[str]]): Mapping of environment variables,
+          such as `os.environ` itself.
 
         Returns:
         - Any: Validated configuration.
@@ -318,16 +482,58 @@ class ConfigParser(Generic[T]):
         # )
         ```
         """
-        preprocessed = _preprocess_var_dict(self.var_prefix, var_dict)
-        proto_config = self._var_dict_to_proto_config(preprocessed)
-        return self.schema.model_validate(proto_config)
+        # Empty vars are skipped while building proto config, so without a prefix to
+        # filter by there's nothing for pre-processing to do
+        if self.var_prefix is not None:
+            var_dict = _preprocess_var_dict(self.var_prefix, var_dict)
+        proto_config = self._var_dict_to_proto_config(var_dict)
+        return self._validate(proto_config)
+
+    def parse_many(self, var_dicts: Iterable[Mapping[str, Optional[str]]]) -> List[T]:
+        """
+        Parse and validate configuration from each of several dictionaries of
+        environment variables, e.g. successive reloads of a dotenv file.
+
+        Args:
+        - var_dicts (Iterable[Mapping[str, Optional[str]]]): Mappings of environment
+          variables.
+
+        Returns:
+        - List[Any]: Validated configurations, in the order of `var_dicts`.
+
+        Example:
+        ```
+        from dotenv import dotenv_values
+        from pydantic_env import ConfigParser
+
+        from .schema import Config
+
+
+        parser = ConfigParser(Config, "MYAPP")
+        configs = parser.parse_many(
+            dotenv_values(path) for path in [".env.default", ".env"]
+        )
+        ```
+        """
+        var_prefix = self.var_prefix
+        to_proto_config = self._var_dict_to_proto_config
+        validate = self._validate
+        if var_prefix is None:
+            return [validate(to_proto_config(var_dict)) for var_dict in var_dicts]
+        return [
+            validate(to_proto_config(_preprocess_var_dict(var_prefix, var_dict)))
+            for var_dict in var_dicts
+        ]
 
 
 def parse(
-    schema: Type[T], var_prefix: Optional[str], var_dict: Dict[str, Optional[str]]
+    schema: Type[T],
+    var_prefix: Optional[str],
+    var_dict: Mapping[str, Optional[str]],
+    strict: bool = True,
 ) -> T:
     """
     Utility function to parse and validate configuration from environment variables.
     """
-    parser = ConfigParser(schema, var_prefix)
+    parser = ConfigParser(schema, var_prefix, strict)
     return parser.parse(var_dict)
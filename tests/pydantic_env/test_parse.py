@@ -1,8 +1,23 @@
+import pickle
+import weakref
+from types import MappingProxyType
+from typing import Optional
+
 import pytest
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from pydantic_env import ConfigParser
 
 
+# Schemas have to be importable from a module for parsers of them to be picklable
+class PicklableSubSchema(BaseModel):
+    sub_field: int
+
+
+class PicklableSchema(BaseModel):
+    field1: str
+    sub_config: PicklableSubSchema
+
+
 @pytest.fixture
 def SubSchema():
     class SubSchema(BaseModel):
@@ -22,12 +37,74 @@ def Schema(SubSchema):
 
 
 class TestConfigParser:
+    def test_has_no_instance_dict(self, Schema):
+        parser = ConfigParser(Schema, "PREFIX")
+        assert not hasattr(parser, "__dict__")
+        assert weakref.ref(parser)() is parser
+
+    def test_can_be_instantiated_through_a_parameterized_alias(self, Schema):
+        parser = ConfigParser[Schema](Schema, "PREFIX")
+        assert parser.schema is Schema
+
+    def test_survives_a_pickle_round_trip(self):
+        parser = ConfigParser(PicklableSchema, "PREFIX", strict=False)
+        unpickled_parser = pickle.loads(pickle.dumps(parser))
+        assert unpickled_parser.schema is PicklableSchema
+        assert unpickled_parser.var_prefix == "PREFIX"
+        assert unpickled_parser.strict is False
+        parsed_config = unpickled_parser.parse(
+            {"PREFIX_FIELD1": "some_value", "PREFIX_SUB_CONFIG_SUB_FIELD": "1"}
+        )
+        assert parsed_config.model_dump() == {
+            "field1": "some_value",
+            "sub_config": {"sub_field": 1},
+        }
+
     class TestPaths:
         def test_can_parse_paths(self, Schema):
             parser = ConfigParser(Schema, "PREFIX")
             expected_paths = [["field1"], ["field2"], ["sub_config", "sub_field"]]
             assert parser._paths(None) == expected_paths
 
+        def test_can_parse_deeply_nested_paths(self):
+            class Leaf(BaseModel):
+                value: int
+
+            class Middle(BaseModel):
+                leaf: Leaf
+                after_leaf: str
+
+            class Root(BaseModel):
+                middle: Middle
+                last: str
+
+            parser = ConfigParser(Root, None)
+            expected_paths = [
+                ["middle", "leaf", "value"],
+                ["middle", "after_leaf"],
+                ["last"],
+            ]
+            assert parser._paths() == expected_paths
+
+        def test_can_parse_paths_through_optional_sub_schemas(self, SubSchema):
+            class Schema(BaseModel):
+                field1: str
+                sub_config: Optional[SubSchema] = None
+
+            parser = ConfigParser(Schema, "PREFIX")
+            expected_paths = [["field1"], ["sub_config", "sub_field"]]
+            assert parser._paths() == expected_paths
+
+        def test_throws_errors_for_cyclic_schemas(self):
+            class Node(BaseModel):
+                name: str
+                child: "Node"
+
+            Node.model_rebuild()
+
+            with pytest.raises(RuntimeError, match="child"):
+                ConfigParser(Node, None)
+
     class TestVarNameToPathTable:
         def test_produces_the_expected_table(self, Schema):
             parser = ConfigParser(Schema, "PREFIX")
@@ -38,6 +115,60 @@ class TestConfigParser:
             }
             assert parser.var_name_to_path_table() == expected_table
 
+        def test_shares_the_table_between_instances_for_a_schema(self, Schema):
+            parser = ConfigParser(Schema, "PREFIX")
+            other_parser = ConfigParser(Schema, None)
+            assert parser._path_table is other_parser._path_table
+
+        def test_returns_a_table_that_is_safe_to_mutate(self, Schema):
+            parser = ConfigParser(Schema, None)
+            table = parser.var_name_to_path_table()
+            table.pop("FIELD1")
+            table["SUB_CONFIG_SUB_FIELD"].append("extra")
+
+            other_parser = ConfigParser(Schema, None)
+            assert other_parser.var_name_to_path_table() == {
+                "FIELD1": ["field1"],
+                "FIELD2": ["field2"],
+                "SUB_CONFIG_SUB_FIELD": ["sub_config", "sub_field"],
+            }
+            parsed_config = other_parser.parse(
+                {"FIELD1": "some_value", "FIELD2": "42", "SUB_CONFIG_SUB_FIELD": "1"}
+            )
+            assert parsed_config.model_dump() == {
+                "field1": "some_value",
+                "field2": 42,
+                "sub_config": {"sub_field": 1},
+            }
+
+        def test_does_not_cache_tables_for_incomplete_schemas(self):
+            class A(BaseModel):
+                x: int
+                b: "B"
+
+            with pytest.raises(Exception):
+                ConfigParser(A, None)
+
+            class B(BaseModel):
+                y: int
+
+            A.model_rebuild()
+
+            parser = ConfigParser(A, None)
+            parsed_config = parser.parse({"X": "1", "B_Y": "2"})
+            assert parsed_config.model_dump() == {"x": 1, "b": {"y": 2}}
+
+        def test_throws_errors_for_ambiguous_schemas_on_construction(self):
+            class Sub(BaseModel):
+                b: int
+
+            class Ambiguous(BaseModel):
+                a_b: int
+                a: Sub
+
+            with pytest.raises(RuntimeError):
+                ConfigParser(Ambiguous, "PREFIX")
+
     class TestParse:
         def test_successfully_parses_prefixed_var_dicts(self, Schema):
             parser = ConfigParser(Schema, "PREFIX")
@@ -53,6 +184,46 @@ class TestConfigParser:
                 "sub_config": {"sub_field": 1},
             }
 
+        def test_successfully_parses_optional_sub_schemas(self, SubSchema):
+            class Schema(BaseModel):
+                field1: str
+                sub_config: Optional[SubSchema] = None
+
+            parser = ConfigParser(Schema, "PREFIX")
+            parsed_config = parser.parse({"PREFIX_FIELD1": "some_value"})
+            assert parsed_config.sub_config is None
+
+            parsed_config = parser.parse(
+                {"PREFIX_FIELD1": "some_value", "PREFIX_SUB_CONFIG_SUB_FIELD": "1"}
+            )
+            assert parsed_config.model_dump() == {
+                "field1": "some_value",
+                "sub_config": {"sub_field": 1},
+            }
+
+        def test_successfully_parses_aliases_that_need_escaping(self):
+            class SubSchema(BaseModel):
+                value: str = Field(alias="it's")
+
+            class Schema(BaseModel):
+                sub_config: SubSchema = Field(alias='sub"config')
+
+            parser = ConfigParser(Schema, None)
+            parsed_config = parser.parse({"SUB\"CONFIG_IT'S": "some_value"})
+            assert parsed_config.sub_config.value == "some_value"
+
+        def test_successfully_parses_recursive_schemas(self):
+            class Node(BaseModel):
+                name: str
+                child: Optional["Node"] = None
+
+            Node.model_rebuild()
+
+            parser = ConfigParser(Node, None)
+            assert parser._paths() == [["name"], ["child"]]
+            parsed_config = parser.parse({"NAME": "x"})
+            assert parsed_config.model_dump() == {"name": "x", "child": None}
+
         def test_throws_errors_for_missing_fields(self, Schema):
             parser = ConfigParser(Schema, "PREFIX")
             var_dict = {
@@ -72,6 +243,42 @@ class TestConfigParser:
             with pytest.raises(Exception):
                 parser.parse(var_dict)
 
+        def test_ignores_empty_unprefixed_vars(self, Schema):
+            parser = ConfigParser(Schema, None)
+            var_dict = {
+                "FIELD1": "some_value",
+                "FIELD2": "42",
+                "SUB_CONFIG_SUB_FIELD": "1",
+                "EXTRA": None,
+            }
+            parsed_config = parser.parse(var_dict)
+            assert parsed_config.model_dump() == {
+                "field1": "some_value",
+                "field2": 42,
+                "sub_config": {"sub_field": 1},
+            }
+
+        def test_treats_empty_unprefixed_vars_as_missing(self, Schema):
+            parser = ConfigParser(Schema, None)
+            var_dict = {"FIELD1": "some_value", "FIELD2": None}
+            with pytest.raises(Exception):
+                parser.parse(var_dict)
+
+        def test_ignores_extra_fields_when_not_strict(self, Schema):
+            parser = ConfigParser(Schema, None, strict=False)
+            var_dict = {
+                "FIELD1": "some_value",
+                "FIELD2": "42",
+                "SUB_CONFIG_SUB_FIELD": "1",
+                "PATH": "/usr/bin",
+            }
+            parsed_config = parser.parse(var_dict)
+            assert parsed_config.model_dump() == {
+                "field1": "some_value",
+                "field2": 42,
+                "sub_config": {"sub_field": 1},
+            }
+
         def test_successfully_parses_unprefixed_var_dicts(self, Schema):
             parser = ConfigParser(Schema, None)
             var_dict = {
@@ -85,3 +292,49 @@ class TestConfigParser:
                 "field2": 42,
                 "sub_config": {"sub_field": 1},
             }
+
+        def test_successfully_parses_non_dict_mappings(self, Schema):
+            parser = ConfigParser(Schema, "PREFIX")
+            var_dict = MappingProxyType(
+                {
+                    "PREFIX_FIELD1": "some_value",
+                    "PREFIX_FIELD2": "42",
+                    "PREFIX_SUB_CONFIG_SUB_FIELD": "1",
+                }
+            )
+            parsed_config = parser.parse(var_dict)
+            assert parsed_config.model_dump() == {
+                "field1": "some_value",
+                "field2": 42,
+                "sub_config": {"sub_field": 1},
+            }
+
+    class TestParseMany:
+        def test_successfully_parses_each_var_dict(self, Schema):
+            parser = ConfigParser(Schema, "PREFIX")
+            var_dicts = [
+                {
+                    "PREFIX_FIELD1": f"value_{i}",
+                    "PREFIX_FIELD2": str(i),
+                    "PREFIX_SUB_CONFIG_SUB_FIELD": "1",
+                }
+                for i in range(3)
+            ]
+            parsed_configs = parser.parse_many(var_dicts)
+            assert [config.model_dump() for config in parsed_configs] == [
+                {"field1": f"value_{i}", "field2": i, "sub_config": {"sub_field": 1}}
+                for i in range(3)
+            ]
+
+        def test_throws_errors_for_any_invalid_var_dict(self, Schema):
+            parser = ConfigParser(Schema, "PREFIX")
+            var_dicts = [
+                {
+                    "PREFIX_FIELD1": "some_value",
+                    "PREFIX_FIELD2": "42",
+                    "PREFIX_SUB_CONFIG_SUB_FIELD": "1",
+                },
+                {"PREFIX_FIELD1": "some_value"},
+            ]
+            with pytest.raises(Exception):
+                parser.parse_many(var_dicts)